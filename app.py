@@ -1,20 +1,134 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from cachelib.file import FileSystemCache
+from flask import Blueprint, Flask, Response, g, render_template, request, jsonify, session, redirect, url_for
+from flask.json.provider import JSONProvider
+from flask_caching import Cache
+from flask_compress import Compress
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from flask_session import Session
 from flask_sqlalchemy import SQLAlchemy
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import bindparam, event, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload, raiseload
+from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import datetime
+from functools import lru_cache
+import orjson
 import os
+import time
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider ของ Flask ที่ใช้ orjson — jsonify/get_json ทุกจุดได้ของเร็วอัตโนมัติ"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 # สร้าง Flask Application
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # ตั้งค่าครับ
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'shop.db')
+DB_PATH = os.path.join(basedir, 'shop.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Connection pool: ใช้ connection เดิมซ้ำข้าม request แทนการเปิด/ปิดใหม่ทุกครั้ง
+# (มีผลเมื่อรันหลาย thread ผ่าน gunicorn; ค่าเดียวกันนี้ใช้ได้เลยถ้าย้ายไป Postgres)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_pre_ping': True,   # เช็ค connection ก่อนใช้ กัน connection ค้าง
+    'pool_recycle': 1800,    # วินาที
+    'connect_args': {'check_same_thread': False},  # ให้ SQLite connection ใช้ข้าม thread ได้
+}
 app.config['SECRET_KEY'] = 'infinite-shop-secret-key-2026'  # สำหรับ session
 
+# บัญชี admin ตั้งผ่าน environment ตอน deploy (ค่า default ไว้สำหรับ dev เท่านั้น)
+# เก็บเป็น hash ใน config — ไม่มีรหัสผ่าน plaintext เทียบใน code
+app.config['ADMIN_USERNAME'] = os.environ.get('ADMIN_USERNAME', 'admin')
+app.config['ADMIN_PASSWORD_HASH'] = generate_password_hash(os.environ.get('ADMIN_PASSWORD', '1234'))
+
+# เก็บ session ฝั่ง server (cookie มีแค่ session id ไม่ต้องเซ็น/ถอดรหัส payload ทุก request)
+app.config['SESSION_TYPE'] = 'cachelib'
+app.config['SESSION_CACHELIB'] = FileSystemCache(os.path.join(basedir, 'flask_session'), threshold=500)
+Session(app)
+
+# Cache สำหรับหน้า HTML ที่ render แล้ว (หน้าแคตตาล็อกเหมือนกันสำหรับทุกคน)
+# ใช้ FileSystemCache เพราะแชร์ข้าม worker — cache.clear() ตอนแก้ข้อมูล
+# ล้างให้ทุก process ไม่ใช่แค่ตัวที่รับ request เขียน (SimpleCache อยู่ใน
+# memory ของใครของมัน worker อื่นจะเสิร์ฟหน้าเก่าต่อจนหมด timeout)
+cache = Cache(app, config={
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': os.path.join(basedir, '.page_cache'),
+    'CACHE_DEFAULT_TIMEOUT': 300,
+})
+
+# บีบอัด response (HTML/JSON ของเรามีข้อความซ้ำเยอะ บีบได้หลายเท่า)
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+Compress(app)
+
+# Rate limit ต่อ IP — กัน bot ยิง endpoint ฝั่งเขียนรัว ๆ จน SQLite writer คอขวด
+# (ปัดทิ้งตั้งแต่ชั้น WSGI ไม่ต้องไปแย่ง lock ใน DB)
+limiter = Limiter(get_remote_address, app=app, default_limits=['200 per minute'])
+
+# ไฟล์ static ให้ browser cache ได้ยาว ๆ (1 ปี)
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000
+
 # สร้าง Database Instance
 db = SQLAlchemy(app)
 
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """ตั้งค่า PRAGMA ของ SQLite ทุกครั้งที่เปิด connection ใหม่"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')      # อ่านกับเขียนพร้อมกันได้ ไม่ล็อกทั้งไฟล์
+    cursor.execute('PRAGMA synchronous=NORMAL')    # ใน WAL mode ปลอดภัยพอ และ fsync น้อยกว่า FULL
+    cursor.execute('PRAGMA cache_size=-65536')     # page cache 64MB ต่อ connection
+    cursor.execute('PRAGMA temp_store=MEMORY')     # temp table/sort ไม่ต้องลงดิสก์
+    cursor.execute('PRAGMA mmap_size=268435456')   # อ่านไฟล์ db ผ่าน mmap (256MB) ลด syscall
+    cursor.execute('PRAGMA busy_timeout=5000')     # รอ lock แทนการ fail ทันทีเมื่อมีคนเขียนอยู่
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+# ปิด auto-reload ของ template (ไม่ต้อง stat ไฟล์ทุก request)
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+app.jinja_env.auto_reload = False
+
+# เก็บ bytecode ของ template ที่ compile แล้วลงดิสก์ — process/worker ใหม่
+# โหลดจาก cache แทนการ parse+compile ใหม่ทุกครั้ง
+_jinja_cache_dir = os.path.join(basedir, '.jinja_cache')
+os.makedirs(_jinja_cache_dir, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory=_jinja_cache_dir)
+
+
+def warm_templates():
+    """Compile template ทุกไฟล์ล่วงหน้าตอน start เพื่อไม่ให้ request แรกต้องรอ compile"""
+    for name in app.jinja_env.list_templates(filter_func=lambda n: n.endswith('.html')):
+        app.jinja_env.get_template(name)
+
+
+@lru_cache(maxsize=None)
+def _rendered_page(template_name):
+    """เก็บผล render ของ template ที่ไม่มีตัวแปรต่อผู้ใช้ — Jinja รันแค่ครั้งแรก"""
+    return render_template(template_name)
+
+
+def render_static_page(template_name):
+    """หน้าที่เนื้อหาเหมือนกันทุก request ใช้ HTML ที่ render ค้างไว้ (ยกเว้นตอน debug)"""
+    if app.debug:
+        return render_template(template_name)
+    return _rendered_page(template_name)
+
+
 # Register Jinja2 filters and globals
 @app.template_filter('int')
 def to_int(value):
@@ -26,6 +140,12 @@ def to_int(value):
 
 app.jinja_env.filters['int'] = to_int
 
+
+def format_datetime(dt):
+    """จัดรูปแบบ dd/mm/YYYY HH:MM ด้วย f-string (เร็วกว่า strftime ที่วิ่งผ่าน locale)"""
+    return f"{dt.day:02d}/{dt.month:02d}/{dt.year} {dt.hour:02d}:{dt.minute:02d}"
+
+
 # ===== Models (ตาราง Database) =====
 class Category(db.Model):
     """Model สำหรับตาราง Category"""
@@ -36,7 +156,7 @@ class Category(db.Model):
     description = db.Column(db.String(500), default='')
     
     # Relationship
-    products = db.relationship('Product', backref='category', lazy=True, cascade='all, delete-orphan')
+    products = db.relationship('Product', back_populates='category', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -54,62 +174,84 @@ class Product(db.Model):
     __tablename__ = 'product'
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
+    name = db.Column(db.String(120), nullable=False, unique=True)
     price = db.Column(db.Float, nullable=False)
     image_url = db.Column(db.String(500), nullable=False)
     discount = db.Column(db.Float, default=0)  # ส่วนลดเป็นเปอร์เซ็นต์ (0-100)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
+    # generated column — SQLite คำนวณราคาหลังส่วนลดให้ตอนอ่าน ใช้ filter/sort ใน SQL ได้
+    sale_price = db.Column(db.Float, db.Computed('price * (1 - discount / 100.0)'))
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True, index=True)
     description = db.Column(db.Text, default='')
+    avg_rating = db.Column(db.Float, default=0)  # คะแนนเฉลี่ย (denormalized จากตาราง review)
+    review_count = db.Column(db.Integer, default=0)  # จำนวนรีวิว (denormalized จากตาราง review)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship
-    reviews = db.relationship('Review', backref='product', lazy=True, cascade='all, delete-orphan')
+    category = db.relationship('Category', back_populates='products')
+    reviews = db.relationship('Review', back_populates='product', lazy=True, cascade='all, delete-orphan')
     
     def get_sale_price(self):
-        """คำนวณราคาหลังส่วนลด"""
+        """ราคาหลังส่วนลด (อ่านจาก generated column ที่ SQLite คำนวณให้)"""
+        if self.sale_price is not None:
+            return self.sale_price
+        # instance ใหม่ที่ยังไม่ flush — คำนวณเองไปก่อน
         return self.price * (1 - self.discount / 100)
     
     def get_average_rating(self):
-        """คำนวณคะแนนเฉลี่ย"""
-        if not self.reviews:
-            return 0
-        total = sum(review.rating for review in self.reviews)
-        return total / len(self.reviews)
-    
+        """คะแนนเฉลี่ย (อ่านจากคอลัมน์ที่ cache ไว้ ไม่ต้องโหลดรีวิวทั้งหมด)"""
+        return self.avg_rating or 0
+
     def get_review_count(self):
-        """นับจำนวนรีวิว"""
-        return len(self.reviews)
+        """จำนวนรีวิว (อ่านจากคอลัมน์ที่ cache ไว้)"""
+        if self.review_count is None:
+            # แถวเก่าที่ยังไม่ถูก backfill — นับด้วย COUNT(*) แทนการโหลดแถวรีวิวทั้งหมด
+            return db.session.query(func.count(Review.id)).filter(Review.product_id == self.id).scalar()
+        return self.review_count
     
     def to_dict(self):
-        """แปลง Product object เป็น dictionary"""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'price': self.price,
-            'image_url': self.image_url,
-            'discount': self.discount,
-            'sale_price': self.get_sale_price() if self.discount > 0 else None,
-            'category': self.category.to_dict() if self.category else None,
-            'description': self.description,
-            'rating': round(self.get_average_rating(), 1),
-            'review_count': self.get_review_count()
-        }
+        """แปลง Product object เป็น dictionary (memoize ต่อ instance
+
+        instance ของ ORM อยู่แค่ช่วงอายุ session ของ request เดียว
+        จึง cache ได้โดยไม่ต้องกังวลเรื่องข้อมูลค้างข้าม request)
+        """
+        cached = self.__dict__.get('_dict_cache')
+        if cached is None:
+            cached = self.__dict__['_dict_cache'] = {
+                'id': self.id,
+                'name': self.name,
+                'price': self.price,
+                'image_url': self.image_url,
+                'discount': self.discount,
+                'sale_price': self.get_sale_price() if self.discount > 0 else None,
+                'category': self.category.to_dict() if self.category else None,
+                'description': self.description,
+                'rating': round(self.get_average_rating(), 1),
+                'review_count': self.get_review_count()
+            }
+        return cached
     
     def __repr__(self):
         return f'<Product {self.name}>'
 
 
+# Partial index สำหรับหน้า /sale — เก็บเฉพาะแถวที่ discount > 0 ตัวจึงเล็กมาก
+db.Index('ix_product_discount_gt0', Product.discount, sqlite_where=Product.discount > 0)
+
+
 class Review(db.Model):
     """Model สำหรับตาราง Review"""
     __tablename__ = 'review'
     
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     customer_name = db.Column(db.String(100), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
     comment = db.Column(db.Text, default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
+
+    # Relationship
+    product = db.relationship('Product', back_populates='reviews')
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -117,7 +259,7 @@ class Review(db.Model):
             'customer_name': self.customer_name,
             'rating': self.rating,
             'comment': self.comment,
-            'created_at': self.created_at.strftime('%d/%m/%Y %H:%M')
+            'created_at': format_datetime(self.created_at)
         }
     
     def __repr__(self):
@@ -139,7 +281,7 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship
-    items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    items = db.relationship('OrderItem', back_populates='order', lazy=True, cascade='all, delete-orphan')
     
     def get_payment_method_display(self):
         """ส่งกลับชื่อแสดงของวิธีการชำระเงิน"""
@@ -163,7 +305,7 @@ class Order(db.Model):
             'payment_method': self.payment_method,
             'total_price': self.total_price,
             'status': self.status,
-            'created_at': self.created_at.strftime('%d/%m/%Y %H:%M'),
+            'created_at': format_datetime(self.created_at),
             'items': [item.to_dict() for item in self.items]
         }
     
@@ -176,12 +318,13 @@ class OrderItem(db.Model):
     __tablename__ = 'order_item'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     
     # Relationship
+    order = db.relationship('Order', back_populates='items')
     product = db.relationship('Product', backref='order_items')
     
     def to_dict(self):
@@ -197,45 +340,230 @@ class OrderItem(db.Model):
         return f'<OrderItem {self.id}>'
 
 
+# ===== Query Helpers =====
+def product_load_options():
+    """Loader options สำหรับโหลด category มาพร้อมกัน (กัน N+1 query)
+
+    ไม่ต้องโหลด reviews แล้ว เพราะหน้า listing อ่านคะแนนจากคอลัมน์
+    avg_rating / review_count ที่ cache ไว้บน Product
+    """
+    options = [selectinload(Product.category)]
+    if app.config.get('SQLALCHEMY_RAISELOAD'):
+        # โหมด debug: ถ้ามี lazy load หลุดมาให้ error ทันที
+        options.append(raiseload('*'))
+    return options
+
+
+def rating_aggregates():
+    """ดึงค่าเฉลี่ยและจำนวนรีวิวของทุกสินค้าด้วย GROUP BY query เดียว
+
+    ส่งกลับ dict: {product_id: (avg_rating, review_count)}
+    """
+    rows = db.session.query(
+        Review.product_id,
+        func.avg(Review.rating),
+        func.count(Review.id)
+    ).group_by(Review.product_id).all()
+    return {product_id: (avg, count) for product_id, avg, count in rows}
+
+
+# ===== Prepared Statements =====
+# ประกอบ select ของ endpoint ร้อน ๆ ไว้ครั้งเดียวตอน import
+# ไม่ต้องสร้าง expression tree ใหม่ทุก request (ฟอร์มที่ compile แล้ว
+# SQLAlchemy 2.x cache ให้เองจาก statement เดิม)
+PRODUCTS_STMT = select(Product).options(*product_load_options())
+PRODUCTS_BY_CATEGORY_STMT = PRODUCTS_STMT.where(Product.category_id == bindparam('category_id'))
+SALE_PRODUCTS_STMT = PRODUCTS_STMT.where(Product.discount > 0)
+REVIEWS_BY_PRODUCT_STMT = select(Review).where(Review.product_id == bindparam('product_id'))
+
+# Core rows สำหรับ API (ไม่ hydrate ORM object)
+PRODUCT_ROWS_STMT = select(
+    Product.id, Product.name, Product.price, Product.image_url,
+    Product.discount, Product.sale_price, Product.description,
+    Product.avg_rating, Product.review_count,
+    Category.id.label('cat_id'),
+    Category.name.label('cat_name'),
+    Category.description.label('cat_description')
+).outerjoin(Category, Product.category_id == Category.id)
+PRODUCT_ROWS_BY_CATEGORY_STMT = PRODUCT_ROWS_STMT.where(Product.category_id == bindparam('category_id'))
+PRODUCT_ROW_BY_ID_STMT = PRODUCT_ROWS_STMT.where(Product.id == bindparam('product_id'))
+
+
+# ===== In-memory TTL Cache =====
+# แคตตาล็อกถูกอ่านบ่อยกว่าถูกแก้ไขมาก เก็บผลลัพธ์ไว้ในหน่วยความจำแล้ว
+# ล้างทิ้งทุกครั้งที่มีการเขียนข้อมูลสินค้า/หมวดหมู่/รีวิว
+CACHE_TTL = 60  # วินาที
+_cache = {}
+
+
+def catalog_db_version():
+    """อ่านเวอร์ชันแคตตาล็อกจาก PRAGMA user_version (ใช้ทำ ETag)
+
+    เก็บตัวเลขไว้ใน header ของไฟล์ SQLite เอง — ทุก worker เห็นค่าเดียวกัน
+    และอยู่รอดข้าม restart (ตัวนับใน memory จะ reset แล้วแจก ETag ซ้ำ
+    ทำให้ client ได้ 304 ทั้งที่ข้อมูลเปลี่ยนไปแล้ว) อ่านครั้งเดียวต่อ request
+    """
+    version = getattr(g, '_catalog_version', None)
+    if version is None:
+        with db.engine.connect() as conn:
+            version = conn.execute(text('PRAGMA user_version')).scalar()
+        g._catalog_version = version
+    return version
+
+
+def cache_get(key):
+    """อ่านค่าจาก cache ถ้ายังไม่หมดอายุ และเวอร์ชันแคตตาล็อกยังเป็นตัวเดิม
+
+    เทียบเวอร์ชันด้วยเพราะ dict นี้อยู่ใน memory ของแต่ละ worker —
+    ถ้า worker อื่นแก้ข้อมูล เวอร์ชันใน DB ขยับแล้ว entry เก่าใช้ไม่ได้ทันที
+    ไม่ต้องรอหมด TTL
+    """
+    entry = _cache.get(key)
+    if (entry and entry[2] == catalog_db_version()
+            and time.time() - entry[0] < CACHE_TTL):
+        return entry[1]
+    return None
+
+
+def cache_set(key, value):
+    _cache[key] = (time.time(), value, catalog_db_version())
+    return value
+
+
+def cache_clear():
+    """ล้าง cache ทั้งหมด เรียกเมื่อข้อมูลในแคตตาล็อกเปลี่ยน"""
+    with db.engine.connect() as conn:
+        version = conn.execute(text('PRAGMA user_version')).scalar() + 1
+        conn.execute(text(f'PRAGMA user_version = {version}'))
+        conn.commit()
+    g._catalog_version = version
+    _cache.clear()
+    cache.clear()  # หน้า HTML ที่ cache ไว้ด้วย Flask-Caching
+
+
+def catalog_response(render_payload, etag_suffix=''):
+    """สร้าง JSON response พร้อม ETag/Cache-Control
+
+    เช็ค If-None-Match ก่อนเรียก render_payload() — ถ้า client มีเวอร์ชัน
+    ล่าสุดอยู่แล้ว ตอบ 304 ได้เลย เหลือแค่อ่าน PRAGMA เดียว ไม่ต้อง query
+    หรือ serialize อะไรทั้งนั้น
+    """
+    etag = f'{catalog_db_version()}{etag_suffix}'
+    # Flask-Compress เขียน ETag ขาออกเป็น "<tag>:br"/"<tag>:gzip" ตอนบีบอัด
+    # ตอนเทียบต้องตัด suffix นั้นทิ้งก่อน ไม่งั้น client ที่ส่ง Accept-Encoding
+    # (ก็คือ browser ทุกตัว) จะไม่เข้าเงื่อนไข 304 เลย
+    if any(tag.split(':', 1)[0] == etag for tag in request.if_none_match):
+        response = Response(status=304)
+    else:
+        payload = render_payload()
+        response = Response(payload, mimetype='application/json')
+        # ใส่ Content-Length ไว้ล่วงหน้า ให้ client จอง buffer ได้พอดี
+        # และไม่ต้อง fallback เป็น chunked encoding
+        response.headers['Content-Length'] = len(payload)
+    response.set_etag(etag)
+    response.cache_control.max_age = CACHE_TTL
+    return response
+
+
+def _product_row_to_dict(row):
+    """สร้าง dict หน้าตาเดียวกับ Product.to_dict() จาก Core row (ไม่ต้องสร้าง ORM object)
+
+    unpack ทั้ง tuple ทีเดียวตามลำดับคอลัมน์ใน PRODUCT_ROWS_STMT
+    เร็วกว่าเข้าถึงแบบ row.name ทีละตัว (ซึ่งต้องผ่าน _mapping lookup)
+    """
+    (product_id, name, price, image_url, discount, sale_price, description,
+     avg_rating, review_count, cat_id, cat_name, cat_description) = row
+    return {
+        'id': product_id,
+        'name': name,
+        'price': price,
+        'image_url': image_url,
+        'discount': discount,
+        'sale_price': sale_price if discount > 0 else None,
+        'category': {
+            'id': cat_id,
+            'name': cat_name,
+            'description': cat_description
+        } if cat_id is not None else None,
+        'description': description,
+        'rating': round(avg_rating or 0, 1),
+        'review_count': review_count or 0
+    }
+
+
+def get_products_cached(category_id=None):
+    """ดึง list ของ product dict จาก cache หรือ query ใหม่ถ้าหมดอายุ
+
+    query ด้วย Core columns + JOIN เดียว ข้ามการ hydrate ORM object ทั้งตัว
+    """
+    key = ('products', category_id)
+    cached = cache_get(key)
+    if cached is None:
+        if category_id is not None:
+            rows = db.session.execute(PRODUCT_ROWS_BY_CATEGORY_STMT, {'category_id': category_id}).all()
+        else:
+            rows = db.session.execute(PRODUCT_ROWS_STMT).all()
+        cached = cache_set(key, [_product_row_to_dict(row) for row in rows])
+    return cached
+
+
+def get_categories_cached():
+    """ดึง list ของ category dict จาก cache"""
+    cached = cache_get(('categories',))
+    if cached is None:
+        cached = cache_set(('categories',), [category.to_dict() for category in Category.query.all()])
+    return cached
+
+
+# ===== Blueprints =====
+# แยก url map เป็นสามกลุ่ม: หน้าร้าน / REST API / หลังบ้าน
+# ยังอยู่ไฟล์เดียวกัน แต่ขึ้น endpoint แยก namespace (shop.* / api.* / admin.*)
+# และตั้งค่าแบบ before_request หรือ cache ต่อกลุ่มได้โดยไม่กระทบกลุ่มอื่น
+shop_bp = Blueprint('shop', __name__)
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+
 # ===== Routes =====
-@app.route('/')
+@shop_bp.route('/')
+@cache.cached()
 def index():
     """หน้าแรก - ดึงข้อมูล Product จาก Database"""
-    products = Product.query.all()
-    categories = Category.query.all()
+    products = db.session.execute(PRODUCTS_STMT).scalars().all()
+    categories = get_categories_cached()
     return render_template('index.html', products=products, categories=categories)
 
 
-@app.route('/category/<category_name>')
+@shop_bp.route('/category/<category_name>')
 def category_filter(category_name):
     """กรองสินค้าตามหมวดหมู่"""
-    category = Category.query.filter_by(name=category_name).first()
+    category = Category.query.filter_by(name=category_name).one_or_none()
     if not category:
-        return redirect(url_for('index'))
+        return redirect(url_for('shop.index'))
     
-    products = Product.query.filter_by(category_id=category.id).all()
-    categories = Category.query.all()
+    products = db.session.execute(PRODUCTS_BY_CATEGORY_STMT, {'category_id': category.id}).scalars().all()
+    categories = get_categories_cached()
     return render_template('index.html', products=products, categories=categories, selected_category=category_name)
 
 
-@app.route('/product/<int:product_id>')
+@shop_bp.route('/product/<int:product_id>')
 def product_detail(product_id):
     """หน้าละเอียดสินค้า พร้อมรีวิว"""
-    product = Product.query.get(product_id)
+    # db.session.get ใช้ identity map ถ้า object อยู่ใน session แล้วไม่ต้อง query ซ้ำ
+    product = db.session.get(Product, product_id, options=[selectinload(Product.reviews)])
     if not product:
-        return redirect(url_for('index'))
-    
-    reviews = Review.query.filter_by(product_id=product_id).all()
-    return render_template('product-detail.html', product=product, reviews=reviews)
+        return redirect(url_for('shop.index'))
 
+    return render_template('product-detail.html', product=product, reviews=product.reviews)
 
-@app.route('/cart')
+
+@shop_bp.route('/cart')
 def cart():
-    """หน้าตะกร้าสินค้า"""
-    return render_template('cart.html')
+    """หน้าตะกร้าสินค้า (เนื้อหาเป็น JavaScript ฝั่ง client ล้วน ๆ)"""
+    return render_static_page('cart.html')
 
 
-@app.route('/checkout', methods=['GET', 'POST'])
+@shop_bp.route('/checkout', methods=['GET', 'POST'])
 def checkout():
     """หน้าชำระเงิน"""
     if request.method == 'POST':
@@ -247,16 +575,34 @@ def checkout():
             customer_address = request.form.get('customer_address')
             payment_method = request.form.get('payment_method')
             cart_data = request.form.get('cart_data')  # JSON string
-            
-            import json
-            cart_items = json.loads(cart_data) if cart_data else []
-            
+
+            cart_items = orjson.loads(cart_data) if cart_data else []
+            if not isinstance(cart_items, list):
+                return render_template('checkout.html', error='ข้อมูลตะกร้าไม่ถูกต้อง')
+
             if not cart_items:
                 return render_template('checkout.html', error='ไม่พบสินค้าในตะกร้า')
-            
-            # คำนวณยอดรวม
-            total_price = sum(item['price'] * item['quantity'] for item in cart_items)
-            
+
+            # ดึงสินค้าทั้งตะกร้าด้วย query เดียว แล้วใช้ราคาจากฝั่ง server
+            # (ไม่เชื่อราคาที่ client ส่งมา)
+            product_ids = [item['id'] for item in cart_items]
+            products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()}
+
+            missing = [item['id'] for item in cart_items if item['id'] not in products]
+            if missing:
+                return render_template('checkout.html', error='สินค้าบางรายการไม่พบในระบบ')
+
+            # รอบเดียว: ตรวจจำนวน คิดราคาฝั่ง server และเตรียมแถว order_item
+            total_price = 0
+            item_rows = []
+            for item in cart_items:
+                quantity = int(item['quantity'])
+                if quantity <= 0:
+                    return render_template('checkout.html', error='จำนวนสินค้าไม่ถูกต้อง')
+                price = products[item['id']].get_sale_price()
+                total_price += price * quantity
+                item_rows.append({'product_id': item['id'], 'quantity': quantity, 'price': price})
+
             # สร้าง Order ใหม่
             new_order = Order(
                 customer_name=customer_name,
@@ -268,20 +614,16 @@ def checkout():
                 status='pending'
             )
             
-            # เพิ่ม OrderItems
-            for item in cart_items:
-                order_item = OrderItem(
-                    product_id=item['id'],
-                    quantity=item['quantity'],
-                    price=item['price']
-                )
-                new_order.items.append(order_item)
-            
-            # บันทึกลง Database
+            # บันทึก Order ก่อนเพื่อให้ได้ id แล้ว insert รายการสินค้าทั้งหมดในคำสั่งเดียว
             db.session.add(new_order)
+            db.session.flush()
+
+            for row in item_rows:
+                row['order_id'] = new_order.id
+            db.session.execute(OrderItem.__table__.insert(), item_rows)
             db.session.commit()
             
-            return redirect(url_for('checkout_success', order_id=new_order.id))
+            return redirect(url_for('shop.checkout_success', order_id=new_order.id))
         
         except Exception as e:
             db.session.rollback()
@@ -290,37 +632,33 @@ def checkout():
     return render_template('checkout.html')
 
 
-@app.route('/checkout/success/<int:order_id>')
+@shop_bp.route('/checkout/success/<int:order_id>')
 def checkout_success(order_id):
     """หน้าแสดงกำลังดำเนินการคำสั่งซื้อสำเร็จ"""
-    order = Order.query.get(order_id)
+    order = db.session.get(Order, order_id,
+                           options=[selectinload(Order.items).selectinload(OrderItem.product)])
     if not order:
-        return redirect(url_for('index'))
+        return redirect(url_for('shop.index'))
     
     return render_template('checkout-success.html', order=order)
 
 
-@app.route('/api/products', methods=['GET'])
+@api_bp.route('/products', methods=['GET'])
 def get_products():
     """API สำหรับดึงข้อมูล Product ทั้งหมด"""
-    category_id = request.args.get('category_id')
-    
-    if category_id:
-        products = Product.query.filter_by(category_id=category_id).all()
-    else:
-        products = Product.query.all()
-    
-    return jsonify([product.to_dict() for product in products])
+    category_id = request.args.get('category_id', type=int)
+    return catalog_response(lambda: orjson.dumps(get_products_cached(category_id)),
+                            etag_suffix=f'-c{category_id}' if category_id is not None else '')
 
 
-@app.route('/api/categories', methods=['GET'])
+@api_bp.route('/categories', methods=['GET'])
 def get_categories():
     """API สำหรับดึงข้อมูล Category ทั้งหมด"""
-    categories = Category.query.all()
-    return jsonify([category.to_dict() for category in categories])
+    return catalog_response(lambda: orjson.dumps(get_categories_cached()), etag_suffix='-cat')
 
 
-@app.route('/api/products', methods=['POST'])
+@api_bp.route('/products', methods=['POST'])
+@limiter.limit('20 per minute')
 def create_product():
     """API สำหรับสร้าง Product ใหม่"""
     try:
@@ -338,7 +676,8 @@ def create_product():
         # เพิ่มลงใน Database
         db.session.add(new_product)
         db.session.commit()
-        
+        cache_clear()
+
         return jsonify({
             'message': 'Product สร้างสำเร็จ',
             'product': new_product.to_dict()
@@ -349,22 +688,25 @@ def create_product():
         return jsonify({'error': str(e)}), 400
 
 
-@app.route('/api/products/<int:product_id>', methods=['GET'])
+@api_bp.route('/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
-    """API สำหรับดึงข้อมูล Product หนึ่งชิ้น"""
-    product = Product.query.get(product_id)
-    
-    if not product:
+    """API สำหรับดึงข้อมูล Product หนึ่งชิ้น (Core row ไม่ต้อง hydrate ORM)"""
+    row = db.session.execute(PRODUCT_ROW_BY_ID_STMT, {'product_id': product_id}).first()
+
+    if row is None:
         return jsonify({'error': 'Product ไม่พบ'}), 404
-    
-    return jsonify(product.to_dict())
+
+    payload = orjson.dumps(_product_row_to_dict(row))
+    return Response(payload, mimetype='application/json',
+                    headers={'Content-Length': len(payload)})
 
 
-@app.route('/api/products/<int:product_id>', methods=['PUT'])
+@api_bp.route('/products/<int:product_id>', methods=['PUT'])
+@limiter.limit('20 per minute')
 def update_product(product_id):
     """API สำหรับแก้ไข Product"""
     try:
-        product = Product.query.get(product_id)
+        product = db.session.get(Product, product_id)
         
         if not product:
             return jsonify({'error': 'Product ไม่พบ'}), 404
@@ -384,7 +726,8 @@ def update_product(product_id):
             product.description = data['description']
         
         db.session.commit()
-        
+        cache_clear()
+
         return jsonify({
             'message': 'Product อัปเดตสำเร็จ',
             'product': product.to_dict()
@@ -395,18 +738,20 @@ def update_product(product_id):
         return jsonify({'error': str(e)}), 400
 
 
-@app.route('/api/products/<int:product_id>', methods=['DELETE'])
+@api_bp.route('/products/<int:product_id>', methods=['DELETE'])
+@limiter.limit('20 per minute')
 def delete_product(product_id):
     """API สำหรับลบ Product"""
     try:
-        product = Product.query.get(product_id)
+        product = db.session.get(Product, product_id)
         
         if not product:
             return jsonify({'error': 'Product ไม่พบ'}), 404
         
         db.session.delete(product)
         db.session.commit()
-        
+        cache_clear()
+
         return jsonify({'message': 'Product ลบสำเร็จ'})
     
     except Exception as e:
@@ -415,7 +760,8 @@ def delete_product(product_id):
 
 
 # ===== Review Routes =====
-@app.route('/api/reviews', methods=['POST'])
+@api_bp.route('/reviews', methods=['POST'])
+@limiter.limit('20 per minute')
 def add_review():
     """API เพิ่มรีวิว/ให้คะแนนสินค้า"""
     try:
@@ -431,7 +777,7 @@ def add_review():
             return jsonify({'error': 'คะแนนต้องระหว่าง 1-5'}), 400
         
         # ตรวจสอบสินค้า
-        product = Product.query.get(product_id)
+        product = db.session.get(Product, product_id)
         if not product:
             return jsonify({'error': 'สินค้าไม่พบ'}), 404
         
@@ -444,7 +790,14 @@ def add_review():
         )
         
         db.session.add(new_review)
+
+        # อัปเดตค่าเฉลี่ยแบบ incremental ไม่ต้องดึงรีวิวทั้งหมดมาคำนวณใหม่
+        old_count = product.review_count or 0
+        product.avg_rating = ((product.avg_rating or 0) * old_count + rating) / (old_count + 1)
+        product.review_count = old_count + 1
+
         db.session.commit()
+        cache_clear()
         
         return jsonify({
             'message': 'เพิ่มรีวิวสำเร็จ',
@@ -456,11 +809,27 @@ def add_review():
         return jsonify({'error': str(e)}), 400
 
 
-@app.route('/api/reviews/<int:product_id>', methods=['GET'])
+def _review_default(obj):
+    """ให้ orjson serialize Review ตรง ๆ ระหว่างเดิน list — ไม่ต้องสร้าง list of dict ก่อน"""
+    if isinstance(obj, Review):
+        return {
+            'id': obj.id,
+            'product_id': obj.product_id,
+            'customer_name': obj.customer_name,
+            'rating': obj.rating,
+            'comment': obj.comment,
+            'created_at': format_datetime(obj.created_at)
+        }
+    raise TypeError
+
+
+@api_bp.route('/reviews/<int:product_id>', methods=['GET'])
 def get_reviews(product_id):
     """API ดึงรีวิวของสินค้า"""
-    reviews = Review.query.filter_by(product_id=product_id).all()
-    return jsonify([review.to_dict() for review in reviews])
+    reviews = db.session.execute(REVIEWS_BY_PRODUCT_STMT, {'product_id': product_id}).scalars().all()
+    payload = orjson.dumps(reviews, default=_review_default)
+    return Response(payload, mimetype='application/json',
+                    headers={'Content-Length': len(payload)})
 
 
 # ===== Admin Routes =====
@@ -469,124 +838,128 @@ def is_admin_logged_in():
     return session.get('admin_logged_in', False)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@admin_bp.before_request
+def require_admin_login():
+    """เช็คสิทธิ์ Admin ที่เดียว ก่อนเข้าทุก route ใน blueprint นี้"""
+    if not is_admin_logged_in():
+        return redirect(url_for('shop.login'))
+
+
+@shop_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """หน้า Login สำหรับ Admin"""
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         
-        # ตรวจสอบข้อมูล
-        if username == 'admin' and password == '1234':
+        # ตรวจสอบข้อมูล (hash ตรวจเฉพาะตอน login — route อื่นเช็คจาก session)
+        if (username == app.config['ADMIN_USERNAME']
+                and check_password_hash(app.config['ADMIN_PASSWORD_HASH'], password or '')):
             session['admin_logged_in'] = True
             session['admin_username'] = username
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('admin.dashboard'))
         else:
             return render_template('login.html', error='ชื่อผู้ใช้ หรือ รหัสผ่านไม่ถูกต้อง')
-    
-    return render_template('login.html')
 
+    return render_static_page('login.html')
 
-@app.route('/logout')
+
+@shop_bp.route('/logout')
 def logout():
     """ออกจากระบบ Admin"""
     session.clear()
-    return redirect(url_for('login'))
+    return redirect(url_for('shop.login'))
 
 
-@app.route('/sale')
+@shop_bp.route('/sale')
+@cache.cached()
 def sale():
     """หน้าสินค้าลดราคา"""
-    products = Product.query.filter(Product.discount > 0).all()
+    products = db.session.execute(SALE_PRODUCTS_STMT).scalars().all()
     return render_template('sale.html', products=products)
 
 
-@app.route('/admin/dashboard')
+@admin_bp.route('/dashboard')
 def dashboard():
     """แดชบอร์ด Admin - แสดงรายการสินค้าทั้งหมด"""
-    if not is_admin_logged_in():
-        return redirect(url_for('login'))
-    
-    products = Product.query.all()
+    products = db.session.execute(PRODUCTS_STMT).scalars().all()
     categories = Category.query.all()
-    orders = Order.query.all()
+    # โหลด items ของทุก order ในชุดเดียว และ product ของแต่ละ item ด้วย JOIN
+    # (ไม่งั้นหน้า order list ยิง 1 + O + O*K query)
+    orders = Order.query.options(selectinload(Order.items).joinedload(OrderItem.product)).all()
     return render_template('admin.html', products=products, categories=categories, orders=orders, username=session.get('admin_username'))
 
 
 # ===== Category Management =====
-@app.route('/admin/categories', methods=['GET'])
+@admin_bp.route('/categories', methods=['GET'])
 def manage_categories():
     """จัดการหมวดหมู่"""
-    if not is_admin_logged_in():
-        return redirect(url_for('login'))
-    
     categories = Category.query.all()
     return render_template('admin-categories.html', categories=categories)
 
 
-@app.route('/admin/categories/add', methods=['POST'])
+@admin_bp.route('/categories/add', methods=['POST'])
 def add_category():
     """เพิ่มหมวดหมู่ใหม่"""
-    if not is_admin_logged_in():
-        return redirect(url_for('login'))
-    
+    # ดึงหมวดหมู่ครั้งเดียว ใช้ซ้ำได้ทุก error branch
+    categories = Category.query.all()
+
     try:
         name = request.form.get('name')
         description = request.form.get('description', '')
-        
+
         if not name:
-            return render_template('admin-categories.html', error='กรุณากรอกชื่อหมวดหมู่')
-        
+            return render_template('admin-categories.html',
+                                 categories=categories,
+                                 error='กรุณากรอกชื่อหมวดหมู่')
+
         # ตรวจสอบว่ามีอยู่แล้วหรือไม่
         existing = Category.query.filter_by(name=name).first()
         if existing:
-            categories = Category.query.all()
-            return render_template('admin-categories.html', 
+            return render_template('admin-categories.html',
                                  categories=categories,
                                  error='หมวดหมู่นี้มีอยู่แล้ว')
-        
+
         new_category = Category(name=name, description=description)
         db.session.add(new_category)
         db.session.commit()
-        
-        return redirect(url_for('manage_categories'))
-    
+        cache_clear()
+
+        return redirect(url_for('admin.manage_categories'))
+
     except Exception as e:
         db.session.rollback()
-        categories = Category.query.all()
-        return render_template('admin-categories.html', 
+        return render_template('admin-categories.html',
                              categories=categories,
                              error=f'เกิดข้อผิดพลาด: {str(e)}')
 
 
-@app.route('/admin/categories/delete/<int:category_id>', methods=['POST'])
+@admin_bp.route('/categories/delete/<int:category_id>', methods=['POST'])
 def delete_category(category_id):
     """ลบหมวดหมู่"""
-    if not is_admin_logged_in():
-        return redirect(url_for('login'))
-    
     try:
-        category = Category.query.get(category_id)
-        
+        category = db.session.get(Category, category_id)
+
         if not category:
-            return redirect(url_for('manage_categories'))
+            return redirect(url_for('admin.manage_categories'))
         
         db.session.delete(category)
         db.session.commit()
-    
+        cache_clear()
+
     except Exception as e:
         db.session.rollback()
-    
-    return redirect(url_for('manage_categories'))
+
+    return redirect(url_for('admin.manage_categories'))
 
 
 # ===== Product Management =====
-@app.route('/admin/add-product', methods=['GET', 'POST'])
+@admin_bp.route('/add-product', methods=['GET', 'POST'])
 def add_product_admin():
     """เพิ่มสินค้าใหม่จาก Admin"""
-    if not is_admin_logged_in():
-        return redirect(url_for('login'))
-    
+    # ดึงหมวดหมู่ครั้งเดียว ใช้ได้ทั้งหน้าแบบฟอร์มและทุก error branch
+    categories = Category.query.all()
+
     if request.method == 'POST':
         try:
             name = request.form.get('name')
@@ -594,11 +967,10 @@ def add_product_admin():
             image_url = request.form.get('image_url')
             category_id = request.form.get('category_id')
             description = request.form.get('description', '')
-            
+
             # ตรวจสอบข้อมูล
             if not name or not price or not image_url:
-                categories = Category.query.all()
-                return render_template('admin-add-product.html', 
+                return render_template('admin-add-product.html',
                                      categories=categories,
                                      error='กรุณากรอกข้อมูลให้ครบ')
             
@@ -614,44 +986,45 @@ def add_product_admin():
             # บันทึกลง Database
             db.session.add(new_product)
             db.session.commit()
-            
-            return redirect(url_for('dashboard'))
+            cache_clear()
+
+            return redirect(url_for('admin.dashboard'))
         
         except ValueError:
-            categories = Category.query.all()
-            return render_template('admin-add-product.html', 
+            return render_template('admin-add-product.html',
                                  categories=categories,
                                  error='ราคาต้องเป็นตัวเลข')
         except Exception as e:
             db.session.rollback()
-            categories = Category.query.all()
-            return render_template('admin-add-product.html', 
+            return render_template('admin-add-product.html',
                                  categories=categories,
                                  error=f'เกิดข้อผิดพลาด: {str(e)}')
-    
-    categories = Category.query.all()
+
     return render_template('admin-add-product.html', categories=categories)
 
 
-@app.route('/admin/delete-product/<int:product_id>', methods=['POST'])
+@admin_bp.route('/delete-product/<int:product_id>', methods=['POST'])
 def delete_product_admin(product_id):
     """ลบสินค้า จาก Admin"""
-    if not is_admin_logged_in():
-        return redirect(url_for('login'))
-    
     try:
-        product = Product.query.get(product_id)
-        
+        product = db.session.get(Product, product_id)
+
         if not product:
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('admin.dashboard'))
         
         db.session.delete(product)
         db.session.commit()
-    
+        cache_clear()
+
     except Exception as e:
         db.session.rollback()
-    
-    return redirect(url_for('dashboard'))
+
+    return redirect(url_for('admin.dashboard'))
+
+
+app.register_blueprint(shop_bp)
+app.register_blueprint(api_bp)
+app.register_blueprint(admin_bp)
 
 
 # ===== Seed Sample Data =====
@@ -665,146 +1038,191 @@ def seed_sample_data():
             {'name': 'Cameras', 'description': 'กล้อง'},
         ]
         
-        for cat_data in categories_data:
-            existing = Category.query.filter_by(name=cat_data['name']).first()
-            if not existing:
-                new_category = Category(name=cat_data['name'], description=cat_data['description'])
-                db.session.add(new_category)
+        # เช็คชื่อหมวดหมู่ที่มีอยู่แล้วด้วย query เดียว (เฉพาะชื่อที่จะ seed) แล้ว insert ที่ขาดเป็นชุด
+        seed_names = [cat['name'] for cat in categories_data]
+        existing_names = {name for (name,) in
+                          db.session.query(Category.name).filter(Category.name.in_(seed_names)).all()}
+        new_categories = [cat for cat in categories_data if cat['name'] not in existing_names]
+        if new_categories:
+            # แค่ flush ลง transaction เดียวกับ products — commit ทีเดียวตอนจบ
+            db.session.bulk_insert_mappings(Category, new_categories)
+            for cat_data in new_categories:
                 print(f"✅ Added category: {cat_data['name']}")
-        
-        db.session.commit()
-        
-        # ดึง categories เพื่อใช้ในการสร้าง products
-        electronics_cat = Category.query.filter_by(name='Electronics').first()
-        computers_cat = Category.query.filter_by(name='Computers').first()
-        cameras_cat = Category.query.filter_by(name='Cameras').first()
+
+        # map ชื่อหมวดหมู่ -> id สำหรับสร้าง products
+        category_ids = {name: cat_id for cat_id, name in db.session.query(Category.id, Category.name).all()}
+        electronics_id = category_ids.get('Electronics')
+        computers_id = category_ids.get('Computers')
+        cameras_id = category_ids.get('Cameras')
         
         # ข้อมูลตัวอย่าง Products
         sample_products = [
             # Electronics
-            Product(
-                name="หูฟังไร้สาย Premium",
-                price=2490.00,
-                image_url="https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=250&fit=crop",
-                discount=15,
-                category_id=electronics_cat.id if electronics_cat else None,
-                description="หูฟังไร้สายคุณภาพสูง มีการบริษัฒน์เสียงที่ชัดเจน"
-            ),
-            Product(
-                name="นาฬิกาสมาร์ทวอทช์",
-                price=4990.00,
-                image_url="https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400&h=250&fit=crop",
-                discount=20,
-                category_id=electronics_cat.id if electronics_cat else None,
-                description="นาฬิกาสมาร์ทวอทช์ พร้อมใจการติดตามสุขภาพ"
-            ),
-            Product(
-                name="แว่นตากันแดด",
-                price=3290.00,
-                image_url="https://images.unsplash.com/photo-1572635196237-14b3f281503f?w=400&h=250&fit=crop",
-                discount=25,
-                category_id=electronics_cat.id if electronics_cat else None,
-                description="แว่นตากันแดด UV protection 100%"
-            ),
+            {
+                'name': "หูฟังไร้สาย Premium",
+                'price': 2490.00,
+                'image_url': "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400&h=250&fit=crop",
+                'discount': 15,
+                'category_id': electronics_id,
+                'description': "หูฟังไร้สายคุณภาพสูง มีการบริษัฒน์เสียงที่ชัดเจน"
+            },
+            {
+                'name': "นาฬิกาสมาร์ทวอทช์",
+                'price': 4990.00,
+                'image_url': "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400&h=250&fit=crop",
+                'discount': 20,
+                'category_id': electronics_id,
+                'description': "นาฬิกาสมาร์ทวอทช์ พร้อมใจการติดตามสุขภาพ"
+            },
+            {
+                'name': "แว่นตากันแดด",
+                'price': 3290.00,
+                'image_url': "https://images.unsplash.com/photo-1572635196237-14b3f281503f?w=400&h=250&fit=crop",
+                'discount': 25,
+                'category_id': electronics_id,
+                'description': "แว่นตากันแดด UV protection 100%"
+            },
             # Computers
-            Product(
-                name="iPad Pro 12.9",
-                price=33900.00,
-                image_url="https://www.apple.com/newsroom/images/product/ipad/standard/Apple-iPad-10th-gen-hero-221018.jpg.og.jpg?202602120420",
-                discount=35,
-                category_id=computers_cat.id if computers_cat else None,
-                description="iPad Pro 12.9 นิ้ว หน้าจอ Retina ความเร็ว M2"
-            ),
-            Product(
-                name="iPhone 16 Pro Max",
-                price=45990.00,
-                image_url="https://www.apple.com/newsroom/images/2024/09/apple-debuts-iphone-16-pro-and-iphone-16-pro-max/article/Apple-iPhone-16-Pro-finish-lineup-240909_big.jpg.large.jpg",
-                discount=40,
-                category_id=computers_cat.id if computers_cat else None,
-                description="iPhone 16 Pro Max กล้อง 48MP กระบวนการ A18 Pro"
-            ),
-            Product(
-                name="Samsung S25 Ultra",
-                price=42990.00,
-                image_url="https://www.dxomark.com/wp-content/uploads/medias/post-181483/Samsung-Galaxy-S25-Ultra_featured-image-packshot-review.jpg",
-                discount=28,
-                category_id=computers_cat.id if computers_cat else None,
-                description="Samsung Galaxy S25 Ultra โทรศัพท์แฟลกชิป Snapdragon"
-            ),
+            {
+                'name': "iPad Pro 12.9",
+                'price': 33900.00,
+                'image_url': "https://www.apple.com/newsroom/images/product/ipad/standard/Apple-iPad-10th-gen-hero-221018.jpg.og.jpg?202602120420",
+                'discount': 35,
+                'category_id': computers_id,
+                'description': "iPad Pro 12.9 นิ้ว หน้าจอ Retina ความเร็ว M2"
+            },
+            {
+                'name': "iPhone 16 Pro Max",
+                'price': 45990.00,
+                'image_url': "https://www.apple.com/newsroom/images/2024/09/apple-debuts-iphone-16-pro-and-iphone-16-pro-max/article/Apple-iPhone-16-Pro-finish-lineup-240909_big.jpg.large.jpg",
+                'discount': 40,
+                'category_id': computers_id,
+                'description': "iPhone 16 Pro Max กล้อง 48MP กระบวนการ A18 Pro"
+            },
+            {
+                'name': "Samsung S25 Ultra",
+                'price': 42990.00,
+                'image_url': "https://www.dxomark.com/wp-content/uploads/medias/post-181483/Samsung-Galaxy-S25-Ultra_featured-image-packshot-review.jpg",
+                'discount': 28,
+                'category_id': computers_id,
+                'description': "Samsung Galaxy S25 Ultra โทรศัพท์แฟลกชิป Snapdragon"
+            },
             # Cameras
-            Product(
-                name="กล้อง DSLR Canon EOS R5",
-                price=159900.00,
-                image_url="https://images.unsplash.com/photo-1502920917128-1aa500764cbd?w=500&h=300&fit=crop&auto=format",
-                discount=30,
-                category_id=cameras_cat.id if cameras_cat else None,
-                description="กล้อง DSLR Canon EOS R5 45MP ระบบ 8K"
-            ),
-            Product(
-                name="กระเป๋า Camera Bag",
-                price=1890.00,
-                image_url="https://images.unsplash.com/photo-1553062407-98eeb64c6a62?w=400&h=250&fit=crop",
-                discount=10,
-                category_id=cameras_cat.id if cameras_cat else None,
-                description="กระเป๋ากล้องคุณภาพสูง พร้อมฟองน้ำบุ้ม"
-            ),
+            {
+                'name': "กล้อง DSLR Canon EOS R5",
+                'price': 159900.00,
+                'image_url': "https://images.unsplash.com/photo-1502920917128-1aa500764cbd?w=500&h=300&fit=crop&auto=format",
+                'discount': 30,
+                'category_id': cameras_id,
+                'description': "กล้อง DSLR Canon EOS R5 45MP ระบบ 8K"
+            },
+            {
+                'name': "กระเป๋า Camera Bag",
+                'price': 1890.00,
+                'image_url': "https://images.unsplash.com/photo-1553062407-98eeb64c6a62?w=400&h=250&fit=crop",
+                'discount': 10,
+                'category_id': cameras_id,
+                'description': "กระเป๋ากล้องคุณภาพสูง พร้อมฟองน้ำบุ้ม"
+            },
         ]
         
         try:
-            # เพิ่มสินค้าใหม่ตามชื่อถ้ายังไม่มีในฐาน
-            added = []
-            for item in sample_products:
-                existing = Product.query.filter_by(name=item.name).first()
-                if not existing:
-                    db.session.add(item)
-                    added.append(item)
-                else:
-                    # update URL/price if changed
-                    changed = False
-                    if existing.image_url != item.image_url:
-                        existing.image_url = item.image_url
-                        changed = True
-                    if existing.price != item.price:
-                        existing.price = item.price
-                        changed = True
-                    if existing.category_id != item.category_id:
-                        existing.category_id = item.category_id
-                        changed = True
-                    if changed:
-                        added.append(existing)
-            if added:
-                db.session.commit()
-                print(f"✅ Sample products inserted/updated {len(added)} item(s):")
-                for product in added:
-                    print(f"   - {product.name} (฿{product.price:.2f})")
-            else:
-                print("✅ All sample products already exist and are up‑to‑date.")
-        
+            # upsert ทั้งชุดใน statement เดียว — แถวใหม่ insert แถวเดิมอัปเดต
+            # URL/ราคา/หมวดหมู่ให้ตรงกับข้อมูลตัวอย่าง (ชื่อสินค้า unique)
+            stmt = sqlite_insert(Product).values(sample_products)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['name'],
+                set_={
+                    'image_url': stmt.excluded.image_url,
+                    'price': stmt.excluded.price,
+                    'category_id': stmt.excluded.category_id,
+                }
+            )
+            db.session.execute(stmt)
+            db.session.commit()
+            print(f"✅ Sample products upserted ({len(sample_products)} item(s))")
+
         except Exception as e:
             db.session.rollback()
             print(f"❌ Error inserting sample data: {str(e)}")
 
 
 # ===== Initialize Database =====
+def migrate_db():
+    """เพิ่มคอลัมน์ใหม่ให้ตารางเดิม ถ้ายังไม่มี (ไม่ได้ใช้ Alembic)"""
+    with app.app_context():
+        # ใช้ table_xinfo เพราะ table_info ไม่แสดง generated column
+        columns = [row[1] for row in db.session.execute(db.text("PRAGMA table_xinfo(product)"))]
+        changed = False
+        if 'avg_rating' not in columns:
+            db.session.execute(db.text("ALTER TABLE product ADD COLUMN avg_rating FLOAT DEFAULT 0"))
+            changed = True
+        if 'review_count' not in columns:
+            db.session.execute(db.text("ALTER TABLE product ADD COLUMN review_count INTEGER DEFAULT 0"))
+            changed = True
+        if 'sale_price' not in columns:
+            db.session.execute(db.text(
+                "ALTER TABLE product ADD COLUMN sale_price FLOAT "
+                "GENERATED ALWAYS AS (price * (1 - discount / 100.0)) VIRTUAL"
+            ))
+            db.session.commit()
+            print("✅ Added generated column product.sale_price")
+        if changed:
+            # backfill ค่าจากรีวิวที่มีอยู่แล้ว ด้วย aggregate query เดียว
+            agg = rating_aggregates()
+            for product in Product.query.all():
+                product.avg_rating, product.review_count = agg.get(product.id, (0, 0))
+            db.session.commit()
+            print("✅ Migrated product rating columns")
+
+        # สร้าง index บนคอลัมน์ที่ใช้ filter บ่อย (create_all ไม่เพิ่ม index ให้ตารางเดิม)
+        for index_sql in (
+            "CREATE INDEX IF NOT EXISTS ix_product_category_id ON product (category_id)",
+            "DROP INDEX IF EXISTS ix_product_discount",
+            "CREATE INDEX IF NOT EXISTS ix_product_discount_gt0 ON product (discount) WHERE discount > 0",
+            "CREATE INDEX IF NOT EXISTS ix_review_product_id ON review (product_id)",
+            "CREATE INDEX IF NOT EXISTS ix_order_item_order_id ON order_item (order_id)",
+            "CREATE INDEX IF NOT EXISTS ix_order_item_product_id ON order_item (product_id)",
+            # unique index บนชื่อสินค้า รองรับ ON CONFLICT(name) ตอน seed
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_product_name ON product (name)",
+        ):
+            db.session.execute(db.text(index_sql))
+        db.session.commit()
+
+
 def init_db():
     """สร้าง Database และตาราง ถ้ายังไม่มี"""
     with app.app_context():
         # สร้างตาราง
         db.create_all()
         print("✅ Database initialized successfully!")
-        print(f"📁 Database file created: {os.path.abspath('shop.db')}")
-        
+        print(f"📁 Database file created: {DB_PATH}")
+
+        # ปรับ schema เดิมให้ตรงกับ model
+        migrate_db()
+
         # เพิ่มข้อมูลตัวอย่าง
         seed_sample_data()
 
+    # เติม bytecode cache ของ template ไว้เลย — gunicorn worker ที่ start
+    # ทีหลังโหลดจาก .jinja_cache/ แทนการ parse+compile ตอนรับ request แรก
+    warm_templates()
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """สร้างตารางและ seed ข้อมูลตัวอย่าง (รันครั้งเดียวก่อน start gunicorn)"""
+    init_db()
+
 
 if __name__ == '__main__':
-    # สร้าง Database เมื่อรันครั้งแรก
+    # สร้าง Database เมื่อรันครั้งแรก (รวม warm template cache แล้ว)
     init_db()
-    
-    # รัน Flask Development Server
+
+    # รัน Flask Development Server (production ใช้ gunicorn ผ่าน wsgi.py)
     print("\n🚀 Starting Infinite Shop Server...")
     print("📍 http://localhost:5000")
     print("💡 Press CTRL+C to stop the server\n")
-    
-    app.run(debug=True, host='localhost', port=5000)
+
+    debug = os.environ.get('FLASK_DEBUG', '0') == '1'
+    app.run(debug=debug, host='localhost', port=5000, threaded=True)
@@ -0,0 +1,10 @@
+"""Entrypoint สำหรับ production WSGI server
+
+รันด้วย gunicorn (จำนวน worker ตาม CPU):
+
+    gunicorn -w 4 -k gthread --threads 4 wsgi:application
+
+สร้างตารางและ seed ข้อมูลก่อนด้วย `flask --app app init-db`
+(แยกออกมาเพื่อไม่ให้ทุก worker รัน migration ซ้ำกัน)
+"""
+from app import app as application